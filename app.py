@@ -4,7 +4,11 @@ from flask import Flask, jsonify, request, redirect, make_response
 from flasgger import Swagger, swag_from
 from config import config
 from models import db, UserTbl, Session
-from auth_utils import AuthUtils, validate_registration_data
+from auth_utils import AuthUtils
+from request_schemas import LOGIN_SCHEMA, REGISTER_SCHEMA, RequestValidationError
+from session_shards import SessionShards
+from readiness import Readiness
+from circuit_breaker import CircuitBreaker, CircuitOpenError, LastKnownGoodStore
 
 app = Flask(__name__)
 
@@ -37,12 +41,25 @@ swagger_config = {
 swagger_template = load_swagger_config()
 swagger = Swagger(app, config=swagger_config, template=swagger_template)
 
-# Initialize database
+# Initialize session shards (registers their binds) and database
+session_shards = SessionShards(app)
 db.init_app(app)
 
+# Circuit breaker around database calls and last-known-good session store
+db_breaker = CircuitBreaker(app)
+session_store = LastKnownGoodStore(app)
+
 # Create database tables
 with app.app_context():
     db.create_all()
+    session_shards.create_all()
+
+# Warm up pools, caches and bcrypt before this process reports ready
+readiness = Readiness()
+if app.config.get('WARMUP_ON_STARTUP', True):
+    readiness.warm_up(app, swagger)
+else:
+    readiness.skip_warm_up()
 
 @app.route('/v1/helloworld', methods=['GET'])
 def hello_world():
@@ -58,6 +75,33 @@ def health_check():
     """
     return jsonify({"status": "healthy"})
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe: warm-up finished and every database answers in time
+    """
+    report, healthy = readiness.check(app.config.get('READINESS_MAX_DB_LATENCY_MS', 500))
+    return jsonify(report), 200 if healthy else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Database circuit breaker state and stale session validation counters
+    """
+    return jsonify({
+        "db_breaker": db_breaker.snapshot(),
+        "session_store": session_store.snapshot()
+    })
+
+def service_unavailable(error):
+    """Shed a request quickly while the database circuit breaker is open"""
+    response = make_response(jsonify({
+        "error": "Service unavailable",
+        "message": "The database is temporarily unavailable, please retry later"
+    }), 503)
+    response.headers['Retry-After'] = str(max(int(error.retry_after + 0.999), 1))
+    return response
+
 @app.route('/api/docs', methods=['GET'])
 def api_docs():
     """
@@ -79,38 +123,20 @@ def register():
     }
     """
     try:
-        # Get JSON data
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "error": "Invalid JSON payload",
-                "message": "Request must contain JSON data"
-            }), 400
-        
-        # Validate input data
-        validation_errors = validate_registration_data(data)
-        if validation_errors:
-            return jsonify({
-                "error": "Validation failed",
-                "details": validation_errors
-            }), 400
-        
-        # Extract and clean data
-        firstname = data.get('firstname').strip()
-        lastname = data.get('lastname').strip()
-        title = data.get('title', '').strip() or None  # Convert empty string to None
-        username = data.get('username').strip().lower()  # Normalize username
-        password = data.get('password')
+        # Decode, normalize and validate the body in one pass
+        try:
+            payload = REGISTER_SCHEMA.load_request(request)
+        except RequestValidationError as e:
+            return jsonify(e.body), e.status_code
         
         # Create user
         try:
             new_user = AuthUtils.create_user(
-                firstname=firstname,
-                lastname=lastname,
-                title=title,
-                username=username,
-                password=password
+                firstname=payload.firstname,
+                lastname=payload.lastname,
+                title=payload.title,
+                username=payload.username,
+                password=payload.password
             )
             
             return jsonify({
@@ -124,6 +150,9 @@ def register():
                 "message": str(e)
             }), 409  # Conflict
         
+    except CircuitOpenError as e:
+        return service_unavailable(e)
+        
     except Exception as e:
         app.logger.error(f"Registration error: {str(e)}")
         return jsonify({
@@ -142,26 +171,14 @@ def login():
     }
     """
     try:
-        # Get JSON data
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "error": "Invalid JSON payload",
-                "message": "Request must contain JSON data"
-            }), 400
-        
-        username = data.get('username', '').strip().lower()
-        password = data.get('password', '')
-        
-        if not username or not password:
-            return jsonify({
-                "error": "Missing credentials",
-                "message": "Username and password are required"
-            }), 400
+        # Decode, normalize and validate the body in one pass
+        try:
+            payload = LOGIN_SCHEMA.load_request(request)
+        except RequestValidationError as e:
+            return jsonify(e.body), e.status_code
         
         # Authenticate user
-        user = AuthUtils.authenticate_user(username, password)
+        user = AuthUtils.authenticate_user(payload.username, payload.password)
         
         if not user:
             return jsonify({
@@ -169,6 +186,9 @@ def login():
                 "message": "Invalid username or password"
             }), 401
         
+        # Serialize before the session commit expires the user and forces a refresh
+        user_data = user.to_dict()
+        
         # Create session
         session = AuthUtils.create_session(user.id)
         
@@ -177,7 +197,7 @@ def login():
         
         response = make_response(jsonify({
             "message": "Login successful",
-            "user": user.to_dict(),
+            "user": user_data,
             "redirect_url": redirect_url
         }))
         
@@ -186,6 +206,9 @@ def login():
         
         return response, 200
         
+    except CircuitOpenError as e:
+        return service_unavailable(e)
+        
     except Exception as e:
         app.logger.error(f"Login error: {str(e)}")
         return jsonify({
@@ -221,6 +244,9 @@ def logout():
                 "message": "Session not found or already expired"
             }), 404
         
+    except CircuitOpenError as e:
+        return service_unavailable(e)
+        
     except Exception as e:
         app.logger.error(f"Logout error: {str(e)}")
         return jsonify({
@@ -228,6 +254,47 @@ def logout():
             "message": "An unexpected error occurred during logout"
         }), 500
 
+@app.route('/v1/logout-all', methods=['POST'])
+def logout_all():
+    """
+    Logout user everywhere by invalidating all of their sessions
+    Expects sessionid in headers
+    """
+    try:
+        session_id = request.headers.get('sessionid')
+        
+        if not session_id:
+            return jsonify({
+                "error": "No session found",
+                "message": "sessionid header is required"
+            }), 400
+        
+        # Only a valid session may log its user out everywhere
+        session = AuthUtils.validate_session(session_id)
+        
+        if not session:
+            return jsonify({
+                "error": "Invalid session",
+                "message": "Session not found or expired"
+            }), 401
+        
+        invalidated = AuthUtils.invalidate_user_sessions(session.user_id)
+        
+        return jsonify({
+            "message": "Logged out from all sessions",
+            "sessions_invalidated": invalidated
+        }), 200
+        
+    except CircuitOpenError as e:
+        return service_unavailable(e)
+        
+    except Exception as e:
+        app.logger.error(f"Logout all error: {str(e)}")
+        return jsonify({
+            "error": "Internal server error",
+            "message": "An unexpected error occurred during logout"
+        }), 500
+
 @app.route('/v1/validate-session', methods=['GET'])
 def validate_session():
     """
@@ -243,21 +310,27 @@ def validate_session():
                 "message": "sessionid header is required"
             }), 400
         
-        # Validate session
-        session = AuthUtils.validate_session(session_id)
+        # Validate session, answered from the last known good result during DB outages
+        session = AuthUtils.check_session(session_id)
         
         if session:
-            return jsonify({
+            body = {
                 "message": "Session is valid",
-                "user": session.user.to_dict(),
+                "user": session.user,
                 "session_id": session.session_id
-            }), 200
+            }
+            if session.stale:
+                body["stale"] = True
+            return jsonify(body), 200
         else:
             return jsonify({
                 "error": "Invalid session",
                 "message": "Session not found or expired"
             }), 401
         
+    except CircuitOpenError as e:
+        return service_unavailable(e)
+        
     except Exception as e:
         app.logger.error(f"Session validation error: {str(e)}")
         return jsonify({
@@ -1,19 +1,42 @@
 """
 Utility functions for authentication and session management
 """
+import time
 import uuid
 import bcrypt
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
 from models import UserTbl, Session, db
+from circuit_breaker import DATABASE_FAILURES, CircuitOpenError, SessionSnapshot, get_db_breaker, get_session_store
+from request_schemas import REGISTER_SCHEMA, RequestValidationError
+from session_shards import get_session_shards
+
+
+@contextmanager
+def guarded_db():
+    """Run database calls through the circuit breaker, rolling back on failure"""
+    with get_db_breaker().guard():
+        try:
+            yield
+        except DATABASE_FAILURES:
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+            raise
+
 
 class AuthUtils:
     """Authentication utility functions"""
     
     @staticmethod
     def hash_password(password: str) -> str:
-        """Hash a password using bcrypt"""
+        """Hash a password using bcrypt with the configured work factor"""
         password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds=current_app.config.get('BCRYPT_LOG_ROUNDS', 12))
         hashed = bcrypt.hashpw(password_bytes, salt)
         return hashed.decode('utf-8')
     
@@ -31,33 +54,38 @@ class AuthUtils:
     
     @staticmethod
     def create_user(firstname: str, lastname: str, title: str, username: str, password: str) -> UserTbl:
-        """Create a new user with hashed password"""
-        # Check if username already exists
-        existing_user = UserTbl.query.filter_by(username=username).first()
-        if existing_user:
-            raise ValueError("Username already exists")
-        
+        """Create a new user with hashed password in a single INSERT ... RETURNING round-trip"""
         # Hash password
         password_hash = AuthUtils.hash_password(password)
         
-        # Create new user
-        new_user = UserTbl(
-            firstname=firstname,
-            lastname=lastname,
-            title=title,
-            username=username,
-            passwordhash=password_hash
-        )
-        
-        db.session.add(new_user)
-        db.session.commit()
+        # The unique constraint on username rejects duplicates, no SELECT beforehand
+        try:
+            with guarded_db():
+                new_user = db.session.execute(
+                    insert(UserTbl)
+                    .values(
+                        firstname=firstname,
+                        lastname=lastname,
+                        title=title,
+                        username=username,
+                        passwordhash=password_hash
+                    )
+                    .returning(UserTbl)
+                ).scalar_one()
+                # Detach so the commit does not expire it and to_dict() needs no refresh
+                db.session.expunge(new_user)
+                db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise ValueError("Username already exists")
         
         return new_user
     
     @staticmethod
     def authenticate_user(username: str, password: str) -> UserTbl:
         """Authenticate user with username and password"""
-        user = UserTbl.query.filter_by(username=username).first()
+        with guarded_db():
+            user = UserTbl.query.filter_by(username=username).first()
         
         if not user:
             return None
@@ -68,93 +96,167 @@ class AuthUtils:
         return None
     
     @staticmethod
-    def create_session(user_id: int, expires_hours: int = 24) -> Session:
-        """Create a new session for a user"""
-        session_id = AuthUtils.generate_session_id()
+    def create_session(user_id: int, expires_hours: int = 24, max_sessions: int = None) -> Session:
+        """Create a new session for a user, evicting the oldest ones beyond the per-user cap.
+
+        Runs as one transaction of two statements (eviction UPDATE and INSERT).
+        """
+        shards = get_session_shards()
+        bind = shards.bind_for_user(user_id)
+        session_id = shards.generate_session_id(user_id)
         expires_at = datetime.utcnow() + timedelta(hours=expires_hours)
-        
-        # Deactivate existing sessions for the user
-        Session.query.filter_by(user_id=user_id, is_active=True).update({'is_active': False})
+        if max_sessions is None:
+            max_sessions = current_app.config.get('MAX_SESSIONS_PER_USER', 5)
         
         # Create new session
         new_session = Session(
             session_id=session_id,
             user_id=user_id,
+            created_at=datetime.utcnow(),
             expires_at=expires_at,
             is_active=True
         )
         
-        db.session.add(new_session)
-        db.session.commit()
+        with guarded_db():
+            # Keep the newest (max_sessions - 1) active sessions to make room for this one
+            evicted = AuthUtils._evict_sessions(user_id, max(max_sessions - 1, 0), bind)
+            
+            # Session rows are written with Core statements so they reach the owning shard
+            db.session.execute(
+                insert(Session).values(
+                    session_id=new_session.session_id,
+                    user_id=new_session.user_id,
+                    created_at=new_session.created_at,
+                    expires_at=new_session.expires_at,
+                    is_active=new_session.is_active
+                ),
+                bind_arguments=bind
+            )
+            db.session.commit()
         
+        store = get_session_store()
+        for evicted_id in evicted:
+            store.discard(evicted_id)
         return new_session
     
     @staticmethod
     def validate_session(session_id: str) -> Session:
         """Validate a session ID"""
-        session = Session.query.filter_by(
-            session_id=session_id,
-            is_active=True
-        ).first()
-        
-        if not session:
-            return None
-        
-        # Check if session is expired
-        if session.expires_at and session.expires_at < datetime.utcnow():
-            session.is_active = False
-            db.session.commit()
-            return None
+        bind = get_session_shards().bind_for_session(session_id)
+        with guarded_db():
+            # Row IDs are only unique per shard, so always refresh the identity map
+            session = db.session.execute(
+                select(Session)
+                .filter_by(session_id=session_id, is_active=True)
+                .execution_options(populate_existing=True),
+                bind_arguments=bind
+            ).scalars().first()
+            
+            if not session:
+                return None
+            
+            # Check if session is expired
+            if session.expires_at and session.expires_at < datetime.utcnow():
+                AuthUtils._deactivate_session(session_id, bind)
+                db.session.commit()
+                get_session_store().discard(session_id)
+                return None
         
         return session
     
+    @staticmethod
+    def check_session(session_id: str) -> SessionSnapshot:
+        """Validate a session, falling back to its last known good result.
+
+        While the database fails or the breaker is open, a session validated
+        within SESSION_STALE_WINDOW_SECONDS (and not expired) is answered
+        from the last-known-good store with ``stale`` set. Anything else
+        raises CircuitOpenError so the caller can shed the request quickly.
+        """
+        store = get_session_store()
+        try:
+            session = AuthUtils.validate_session(session_id)
+            if session is None:
+                store.discard(session_id)
+                return None
+            with guarded_db():
+                user = session.user.to_dict()
+            snapshot = SessionSnapshot(session.session_id, session.user_id, user,
+                                       session.expires_at, time.monotonic())
+        except (CircuitOpenError, *DATABASE_FAILURES) as e:
+            snapshot = store.get_stale(session_id, datetime.utcnow())
+            if snapshot is not None:
+                return snapshot
+            store.record_shed()
+            if isinstance(e, CircuitOpenError):
+                raise
+            raise CircuitOpenError(get_db_breaker().retry_after()) from e
+        
+        store.put(snapshot)
+        return snapshot
+    
     @staticmethod
     def invalidate_session(session_id: str) -> bool:
         """Invalidate a session"""
-        session = Session.query.filter_by(session_id=session_id).first()
-        if session:
-            session.is_active = False
+        get_session_store().discard(session_id)
+        bind = get_session_shards().bind_for_session(session_id)
+        with guarded_db():
+            updated = AuthUtils._deactivate_session(session_id, bind)
             db.session.commit()
-            return True
-        return False
-
-def validate_registration_data(data: dict) -> dict:
-    """Validate registration data and return errors if any"""
-    errors = {}
+        return updated > 0
     
-    required_fields = ['firstname', 'lastname', 'username', 'password']
-    for field in required_fields:
-        if not data.get(field) or not data.get(field).strip():
-            errors[field] = f"{field.capitalize()} is required"
-    
-    # Username validation
-    username = data.get('username', '').strip()
-    if username:
-        if len(username) < 3:
-            errors['username'] = "Username must be at least 3 characters long"
-        if len(username) > 80:
-            errors['username'] = "Username must be less than 80 characters"
-    
-    # Password validation
-    password = data.get('password', '')
-    if password:
-        if len(password) < 6:
-            errors['password'] = "Password must be at least 6 characters long"
-        if len(password) > 100:
-            errors['password'] = "Password must be less than 100 characters"
-    
-    # Name validation
-    firstname = data.get('firstname', '').strip()
-    if firstname and len(firstname) > 100:
-        errors['firstname'] = "First name must be less than 100 characters"
-    
-    lastname = data.get('lastname', '').strip()
-    if lastname and len(lastname) > 100:
-        errors['lastname'] = "Last name must be less than 100 characters"
+    @staticmethod
+    def invalidate_user_sessions(user_id: int) -> int:
+        """Invalidate every active session of a user, returning how many were invalidated"""
+        store = get_session_store()
+        store.discard_user(user_id)
+        with guarded_db():
+            evicted = AuthUtils._evict_sessions(user_id, 0, get_session_shards().bind_for_user(user_id))
+            db.session.commit()
+        for evicted_id in evicted:
+            store.discard(evicted_id)
+        return len(evicted)
     
-    # Title validation (optional)
-    title = data.get('title', '').strip()
-    if title and len(title) > 50:
-        errors['title'] = "Title must be less than 50 characters"
+    @staticmethod
+    def _evict_sessions(user_id: int, keep: int, bind) -> list:
+        """Deactivate all but the newest ``keep`` active sessions of a user in one statement.
+
+        Returns the evicted session IDs so they can be dropped from the
+        last-known-good store as well.
+        """
+        active = update(Session).filter_by(user_id=user_id, is_active=True)
+        if keep > 0:
+            # Served by ix_session_user_active: newest first, skip the ones we keep
+            oldest = (
+                select(Session.id)
+                .filter_by(user_id=user_id, is_active=True)
+                .order_by(Session.created_at.desc(), Session.id.desc())
+                .offset(keep)
+            )
+            active = active.where(Session.id.in_(oldest))
+        result = db.session.execute(
+            active.values(is_active=False)
+            .returning(Session.session_id)
+            .execution_options(synchronize_session=False),
+            bind_arguments=bind
+        )
+        return result.scalars().all()
     
-    return errors
+    @staticmethod
+    def _deactivate_session(session_id: str, bind) -> int:
+        """Mark a session inactive on its shard, returning the affected row count"""
+        result = db.session.execute(
+            update(Session)
+            .filter_by(session_id=session_id)
+            .values(is_active=False),
+            bind_arguments=bind
+        )
+        return result.rowcount
+
+def validate_registration_data(data: dict) -> dict:
+    """Validate registration data and return errors if any"""
+    try:
+        REGISTER_SCHEMA.load(data)
+    except RequestValidationError as e:
+        return e.body['details']
+    return {}
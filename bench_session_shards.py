@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark login session write throughput across SESSION shard counts
+
+Each run creates fresh SQLite files in a temporary directory and has a pool
+of worker threads call AuthUtils.create_session concurrently, which is the
+write path every successful login takes.
+
+Usage:
+    python bench_session_shards.py [--shards 1 2 4 8] [--workers 8] [--writes 250]
+"""
+import argparse
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from auth_utils import AuthUtils
+from models import db
+from session_shards import SessionShards
+
+
+def build_app(directory: str, shard_count: int) -> Flask:
+    """Create an app with its main database and shards under ``directory``"""
+    bench_app = Flask(__name__)
+    bench_app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{directory}/main.db',
+        SESSION_SHARD_COUNT=shard_count,
+        SESSION_SHARD_URI_TEMPLATE=f'sqlite:///{directory}/sessions_{{shard}}.db',
+        SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}}
+    )
+    shards = SessionShards(bench_app)
+    db.init_app(bench_app)
+    with bench_app.app_context():
+        db.create_all()
+        shards.create_all()
+    return bench_app
+
+
+def run_worker(bench_app: Flask, writes: int, user_pool: int) -> int:
+    """Create ``writes`` sessions for random users, returning the failure count"""
+    failures = 0
+    with bench_app.app_context():
+        for _ in range(writes):
+            try:
+                AuthUtils.create_session(random.randint(1, user_pool))
+            except Exception:
+                db.session.rollback()
+                failures += 1
+        db.session.remove()
+    return failures
+
+
+def run_benchmark(shard_count: int, workers: int, writes: int, user_pool: int) -> dict:
+    """Run one benchmark round and return its throughput figures"""
+    with tempfile.TemporaryDirectory() as directory:
+        bench_app = build_app(directory, shard_count)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            failures = sum(executor.map(
+                lambda _: run_worker(bench_app, writes, user_pool), range(workers)
+            ))
+        elapsed = time.perf_counter() - started
+        with bench_app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    total = workers * writes
+    return {
+        'shards': shard_count,
+        'writes': total,
+        'failures': failures,
+        'seconds': elapsed,
+        'writes_per_second': (total - failures) / elapsed
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=250, help='Writes per worker')
+    parser.add_argument('--users', type=int, default=1000, help='Size of the user pool')
+    args = parser.parse_args()
+
+    print(f"{'Shards':>6} | {'Writes':>7} | {'Failed':>6} | {'Seconds':>8} | {'Writes/s':>9}")
+    print('-' * 49)
+    for shard_count in args.shards:
+        result = run_benchmark(shard_count, args.workers, args.writes, args.users)
+        print(
+            f"{result['shards']:>6} | {result['writes']:>7} | {result['failures']:>6} | "
+            f"{result['seconds']:>8.2f} | {result['writes_per_second']:>9.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Circuit breaker for database calls and last-known-good session snapshots
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import current_app
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+# Errors that mean the database is unhealthy, as opposed to a bad request
+# (e.g. IntegrityError on a duplicate username)
+DATABASE_FAILURES = (OperationalError, InterfaceError, PoolTimeoutError)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the database while the breaker is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Database circuit breaker is open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling the database after repeated failures or slow calls.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    every guarded call is rejected for ``reset_timeout`` seconds. It then lets
+    a single trial call through (half open); success closes it again, failure
+    re-opens it. Calls slower than ``slow_call_ms`` count as failures.
+    """
+
+    def __init__(self, app=None):
+        self.failure_threshold = 5
+        self.reset_timeout = 10.0
+        self.slow_call_ms = None
+        self.lock = threading.Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.failure_threshold = app.config.get('DB_BREAKER_FAILURE_THRESHOLD', 5)
+        self.reset_timeout = app.config.get('DB_BREAKER_RESET_TIMEOUT_SECONDS', 10.0)
+        self.slow_call_ms = app.config.get('DB_BREAKER_SLOW_CALL_MS')
+        app.extensions['db_breaker'] = self
+
+    def reset(self) -> None:
+        """Close the breaker and clear its counters"""
+        with self.lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+            self.metrics = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a trial call through"""
+        if self.opened_at is None:
+            return 0.0
+        return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """Return whether a call may go to the database now"""
+        with self.lock:
+            if self.state == OPEN and self.retry_after() == 0:
+                self.state = HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.metrics['rejected'] += 1
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.metrics['calls'] += 1
+            self.consecutive_failures = 0
+            self.state = CLOSED
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.metrics['calls'] += 1
+            self.metrics['failures'] += 1
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.metrics['opened'] += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """Let another half-open trial through without recording an outcome"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    @contextmanager
+    def guard(self):
+        """Run a block of database calls through the breaker"""
+        if not self.allow():
+            raise CircuitOpenError(self.retry_after())
+        started = time.perf_counter()
+        try:
+            yield
+        except DATABASE_FAILURES:
+            self.record_failure()
+            raise
+        except Exception:
+            # The database answered, the caller just did not like the answer
+            self.record_success()
+            raise
+        except BaseException:
+            # Interrupted (worker timeout, KeyboardInterrupt): no verdict on the
+            # database, but free the half-open trial slot for the next call
+            self.release_trial()
+            raise
+        if self.slow_call_ms is not None and (time.perf_counter() - started) * 1000 > self.slow_call_ms:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def snapshot(self) -> dict:
+        """Breaker state and counters for /metrics"""
+        with self.lock:
+            return dict(self.metrics, state=self.state,
+                        consecutive_failures=self.consecutive_failures,
+                        retry_after_seconds=round(self.retry_after(), 3))
+
+
+class SessionSnapshot:
+    """What a successful session validation returned, detached from the database"""
+    __slots__ = ('session_id', 'user_id', 'user', 'expires_at', 'validated_at', 'stale')
+
+    def __init__(self, session_id: str, user_id: int, user: dict, expires_at, validated_at: float,
+                 stale: bool = False):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.user = user
+        self.expires_at = expires_at
+        self.validated_at = validated_at
+        self.stale = stale
+
+
+class LastKnownGoodStore:
+    """Bounded LRU of recently validated sessions, served while the database is down"""
+
+    def __init__(self, app=None):
+        self.max_entries = 10000
+        self.stale_window = 60.0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics = {'stale_served': 0, 'stale_misses': 0, 'shed': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.max_entries = app.config.get('SESSION_STALE_CACHE_SIZE', 10000)
+        self.stale_window = app.config.get('SESSION_STALE_WINDOW_SECONDS', 60.0)
+        app.extensions['session_lkg_store'] = self
+
+    def put(self, snapshot: SessionSnapshot) -> None:
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[snapshot.session_id] = snapshot
+            self.entries.move_to_end(snapshot.session_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, session_id: str) -> None:
+        with self.lock:
+            self.entries.pop(session_id, None)
+
+    def discard_user(self, user_id: int) -> None:
+        with self.lock:
+            for session_id in [key for key, entry in self.entries.items() if entry.user_id == user_id]:
+                del self.entries[session_id]
+
+    def get_stale(self, session_id: str, now_utc) -> SessionSnapshot:
+        """Return a copy marked stale if validated within the window and not expired"""
+        with self.lock:
+            entry = self.entries.get(session_id)
+            fresh = (
+                entry is not None
+                and time.monotonic() - entry.validated_at <= self.stale_window
+                and (entry.expires_at is None or entry.expires_at > now_utc)
+            )
+            if not fresh:
+                self.metrics['stale_misses'] += 1
+                return None
+            self.metrics['stale_served'] += 1
+            return SessionSnapshot(entry.session_id, entry.user_id, entry.user,
+                                   entry.expires_at, entry.validated_at, stale=True)
+
+    def record_shed(self) -> None:
+        with self.lock:
+            self.metrics['shed'] += 1
+
+    def snapshot(self) -> dict:
+        """Store size and stale-serve counters for /metrics"""
+        with self.lock:
+            return dict(self.metrics, entries=len(self.entries), max_entries=self.max_entries,
+                        stale_window_seconds=self.stale_window)
+
+
+def get_db_breaker() -> CircuitBreaker:
+    """Return the breaker of the current app (a closed, unshared one if not set up)"""
+    return current_app.extensions.get('db_breaker') or CircuitBreaker()
+
+
+def get_session_store() -> LastKnownGoodStore:
+    """Return the last-known-good store of the current app (an empty one if not set up)"""
+    return current_app.extensions.get('session_lkg_store') or LastKnownGoodStore()
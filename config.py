@@ -18,9 +18,32 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Session sharding: 0 or 1 keeps SESSION on the main database, N > 1 spreads
+    # it across N databases built from the template (``{shard}`` is replaced)
+    SESSION_SHARD_COUNT = int(os.environ.get('SESSION_SHARD_COUNT', 1))
+    SESSION_SHARD_URI_TEMPLATE = os.environ.get('SESSION_SHARD_URI_TEMPLATE') or 'sqlite:///sessions_{shard}.db'
+    
     # Security configuration
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     
+    # bcrypt work factor (log2 of the number of rounds)
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    
+    # Concurrent sessions per user; logging in beyond this evicts the oldest ones
+    MAX_SESSIONS_PER_USER = int(os.environ.get('MAX_SESSIONS_PER_USER', 5))
+    
+    # Startup warm-up and readiness (/ready)
+    WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', 'True').lower() in ['true', '1', 'on']
+    WARMUP_POOL_CONNECTIONS = int(os.environ.get('WARMUP_POOL_CONNECTIONS', 4))
+    READINESS_MAX_DB_LATENCY_MS = float(os.environ.get('READINESS_MAX_DB_LATENCY_MS', 500))
+    
+    # Database circuit breaker and stale session validation during outages
+    DB_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('DB_BREAKER_FAILURE_THRESHOLD', 5))
+    DB_BREAKER_RESET_TIMEOUT_SECONDS = float(os.environ.get('DB_BREAKER_RESET_TIMEOUT_SECONDS', 10))
+    DB_BREAKER_SLOW_CALL_MS = float(os.environ.get('DB_BREAKER_SLOW_CALL_MS', 1000))
+    SESSION_STALE_WINDOW_SECONDS = float(os.environ.get('SESSION_STALE_WINDOW_SECONDS', 60))
+    SESSION_STALE_CACHE_SIZE = int(os.environ.get('SESSION_STALE_CACHE_SIZE', 10000))
+    
     # Login redirect URL
     LOGIN_REDIRECT_URL = os.environ.get('LOGIN_REDIRECT_URL', 'http://localhost:3000/dashboard')
 
@@ -39,7 +62,8 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # In-memory database for tests
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # In-memory database for tests, one per process
+    BCRYPT_LOG_ROUNDS = 4  # Minimum bcrypt cost, hashes stay valid but take microseconds
 
 # Configuration dictionary
 config = {
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Load generator and trace replayer for the authentication API
+
+Synthesizes a production-shaped mix of register, login, validate-session and
+logout calls with Poisson arrivals, or replays a previously recorded NDJSON
+trace, and reports latency percentiles and error rates per operation.
+
+Usage:
+    # 60s of open-loop traffic at 50 req/s against a running server
+    python loadgen.py --rate 50 --duration 60 --mix register=1,login=4,validate=20,logout=2
+
+    # Record what was sent, then replay it at twice the original speed
+    python loadgen.py --rate 50 --duration 60 --record trace.ndjson
+    python loadgen.py --replay trace.ndjson --speed 2 --report-json report.json
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+OPERATIONS = ('register', 'login', 'validate', 'logout')
+DEFAULT_MIX = {'register': 1, 'login': 4, 'validate': 20, 'logout': 2}
+PASSWORD = 'loadtest-password'
+
+
+def parse_mix(text: str) -> dict:
+    """Parse ``register=1,login=4,...`` into operation weights"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("At least one operation needs a positive weight")
+    return mix
+
+
+def synthesize(mix: dict, rate: float, duration: float, users: int, seed: int = None):
+    """Yield trace events with Poisson arrivals at ``rate`` requests per second"""
+    rng = random.Random(seed)
+    names = [name for name in OPERATIONS if mix.get(name, 0) > 0]
+    weights = [mix[name] for name in names]
+    offset = rng.expovariate(rate)
+    while offset < duration:
+        yield {'t': round(offset, 6), 'op': rng.choices(names, weights)[0], 'user': rng.randrange(users)}
+        offset += rng.expovariate(rate)
+
+
+def read_trace(path: str) -> list:
+    """Read NDJSON trace events sorted by their offset"""
+    with open(path, 'r') as file:
+        events = [json.loads(line) for line in file if line.strip()]
+    return sorted(events, key=lambda event: event['t'])
+
+
+class UserPool:
+    """Tracks which synthetic users are registered and their current sessions"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.registered = set()
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def username(self, user: int) -> str:
+        return f'{self.prefix}_{user}'
+
+    def resolve(self, op: str, user: int) -> str:
+        """Downgrade an operation the user's state cannot serve yet.
+
+        validate/logout need a session, login needs a registered user, and a
+        registered user logs in instead of registering again.
+        """
+        with self.lock:
+            if op in ('validate', 'logout') and user not in self.sessions:
+                op = 'login'
+            if op == 'login' and user not in self.registered:
+                op = 'register'
+            if op == 'register' and user in self.registered:
+                op = 'login'
+            return op
+
+
+class HttpTransport:
+    """Sends requests to a running server with one keep-alive session per thread"""
+
+    def __init__(self, base_url: str, timeout: float = 10):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def __call__(self, method: str, path: str, headers: dict = None, body: dict = None) -> tuple:
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        response = session.request(method, self.base_url + path, headers=headers,
+                                   json=body, timeout=self.timeout)
+        return response.status_code, response.headers
+
+
+class FlaskTransport:
+    """Sends requests through a Flask test client (no server needed)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __call__(self, method: str, path: str, headers: dict = None, body: dict = None) -> tuple:
+        response = self.client.open(path, method=method, headers=headers, json=body)
+        return response.status_code, response.headers
+
+
+class LoadRunner:
+    """Dispatches trace events on schedule and records their outcome"""
+
+    def __init__(self, transport, pool: UserPool, concurrency: int = 16):
+        self.transport = transport
+        self.pool = pool
+        self.concurrency = concurrency
+        self.results = []
+        self.results_lock = threading.Lock()
+
+    def run(self, events, speed: float = 1.0) -> list:
+        """Send every event at ``t / speed`` seconds after start, return the results"""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for event in events:
+                scheduled = event['t'] / speed
+                delay = scheduled - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.execute, event, scheduled, started)
+        return sorted(self.results, key=lambda result: result['t'])
+
+    def execute(self, event: dict, scheduled: float, run_started: float) -> None:
+        """Send one event.
+
+        ``t`` stays the scheduled offset from the trace, so a replay keeps the
+        original arrival times however far this run fell behind, and
+        ``sent_t`` is when the request actually went out. ``lag_ms`` is the
+        difference, including time spent queued for a free worker, so
+        ``lag_ms`` plus ``latency_ms`` is the delay a real client arriving on
+        schedule sees.
+        """
+        started = time.perf_counter()
+        sent_at = started - run_started
+        op = self.pool.resolve(event['op'], event['user'])
+        try:
+            status = self.send(op, event['user'])
+            error = None
+        except Exception as e:
+            status = None
+            error = e.__class__.__name__
+        result = {
+            't': event['t'],
+            'sent_t': round(sent_at, 6),
+            'op': op,
+            'user': event['user'],
+            'status': status,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+            'lag_ms': round((sent_at - scheduled) * 1000, 3)
+        }
+        if error:
+            result['error'] = error
+        with self.results_lock:
+            self.results.append(result)
+
+    def send(self, op: str, user: int) -> int:
+        """Issue one API call and update the user pool from its outcome"""
+        pool = self.pool
+        username = pool.username(user)
+
+        if op == 'register':
+            status, _ = self.transport('POST', '/v1/register', body={
+                'firstname': 'Load', 'lastname': 'Test', 'username': username, 'password': PASSWORD
+            })
+            if status in (201, 409):
+                with pool.lock:
+                    pool.registered.add(user)
+            return status
+
+        if op == 'login':
+            status, headers = self.transport('POST', '/v1/login', body={
+                'username': username, 'password': PASSWORD
+            })
+            if status == 200:
+                with pool.lock:
+                    pool.sessions[user] = headers.get('sessionid')
+            return status
+
+        with pool.lock:
+            session_id = pool.sessions.get(user)
+        if op == 'validate':
+            status, _ = self.transport('GET', '/v1/validate-session', headers={'sessionid': session_id})
+            if status == 401:
+                with pool.lock:
+                    pool.sessions.pop(user, None)
+            return status
+
+        status, _ = self.transport('POST', '/v1/logout', headers={'sessionid': session_id})
+        with pool.lock:
+            pool.sessions.pop(user, None)
+        return status
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def summarize(results: list) -> dict:
+    """Aggregate results into per-operation latency, lag and error-rate figures.
+
+    Transport failures and 5xx responses count as errors; 4xx responses are
+    reported by status code since some (e.g. 409 on re-register) are expected.
+    """
+    report = {}
+    groups = {'all': results}
+    for result in results:
+        groups.setdefault(result['op'], []).append(result)
+
+    # Throughput is over the time requests were actually sent, not the schedule
+    elapsed = max((result.get('sent_t', result['t']) for result in results), default=0) or 1
+    for name, group in groups.items():
+        latencies = sorted(result['latency_ms'] for result in group)
+        lags = sorted(result['lag_ms'] for result in group)
+        errors = sum(1 for result in group if result['status'] is None or result['status'] >= 500)
+        statuses = {}
+        for result in group:
+            key = str(result['status'] or result.get('error'))
+            statuses[key] = statuses.get(key, 0) + 1
+        report[name] = {
+            'requests': len(group),
+            'throughput_rps': round(len(group) / elapsed, 2),
+            'error_rate': round(errors / len(group), 4) if group else 0,
+            'statuses': statuses,
+            'p50_ms': percentile(latencies, 0.50),
+            'p90_ms': percentile(latencies, 0.90),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': latencies[-1] if latencies else None,
+            'lag_p50_ms': percentile(lags, 0.50),
+            'lag_p90_ms': percentile(lags, 0.90),
+            'lag_p99_ms': percentile(lags, 0.99),
+            'lag_max_ms': lags[-1] if lags else None
+        }
+    return report
+
+
+def print_report(report: dict) -> None:
+    if not report['all']['requests']:
+        print('No requests were sent')
+        return
+    print(f"{'Operation':<10} | {'Requests':>8} | {'RPS':>7} | {'Errors':>7} | "
+          f"{'p50 ms':>8} | {'p90 ms':>8} | {'p99 ms':>8} | {'max ms':>8} | "
+          f"{'lag p99':>8} | {'lag max':>8}")
+    print('-' * 106)
+    for name in OPERATIONS + ('all',):
+        if name not in report:
+            continue
+        row = report[name]
+        print(f"{name:<10} | {row['requests']:>8} | {row['throughput_rps']:>7} | "
+              f"{row['error_rate']:>7.2%} | {row['p50_ms']:>8.1f} | {row['p90_ms']:>8.1f} | "
+              f"{row['p99_ms']:>8.1f} | {row['max_ms']:>8.1f} | "
+              f"{row['lag_p99_ms']:>8.1f} | {row['lag_max_ms']:>8.1f}")
+
+
+def write_ndjson(path: str, rows: list) -> None:
+    with open(path, 'w') as file:
+        for row in rows:
+            file.write(json.dumps(row) + '\n')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Operation weights, e.g. register=1,login=4,validate=20,logout=2')
+    parser.add_argument('--rate', type=float, default=20, help='Mean arrivals per second')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of traffic to generate')
+    parser.add_argument('--users', type=int, default=200, help='Size of the synthetic user pool')
+    parser.add_argument('--user-prefix', default=None,
+                        help='Username prefix, defaults to a fresh one per run')
+    parser.add_argument('--concurrency', type=int, default=32, help='Maximum requests in flight')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for a reproducible synthetic trace')
+    parser.add_argument('--replay', default=None, help='Replay this NDJSON trace instead of synthesizing')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed multiplier')
+    parser.add_argument('--record', default=None, help='Write the requests sent as an NDJSON trace')
+    parser.add_argument('--report-json', default=None, help='Write the summary report as JSON')
+    args = parser.parse_args()
+
+    if args.replay:
+        events = read_trace(args.replay)
+    else:
+        events = synthesize(args.mix, args.rate, args.duration, args.users, args.seed)
+
+    pool = UserPool(args.user_prefix or f'load_{uuid.uuid4().hex[:8]}')
+    runner = LoadRunner(HttpTransport(args.base_url), pool, args.concurrency)
+    results = runner.run(events, args.speed)
+
+    if args.record:
+        write_ndjson(args.record, results)
+    report = summarize(results)
+    print_report(report)
+    if args.report_json:
+        with open(args.report_json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
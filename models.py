@@ -48,5 +48,10 @@ class Session(db.Model):
     # Relationship
     user = db.relationship('UserTbl', backref=db.backref('sessions', lazy=True))
     
+    # Per-user active session lookups (login eviction, logout everywhere)
+    __table_args__ = (
+        db.Index('ix_session_user_active', 'user_id', 'is_active', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Session {self.session_id}>'
@@ -0,0 +1,115 @@
+"""
+Startup warm-up and readiness checks
+"""
+import time
+from sqlalchemy import text
+from auth_utils import AuthUtils
+from models import db
+
+
+class Readiness:
+    """Tracks whether this process has finished warming up"""
+
+    def __init__(self):
+        self.ready = False
+        self.warmup = {}
+
+    def warm_up(self, app, swagger=None) -> dict:
+        """Pre-open DB connections, prime caches and calibrate bcrypt.
+
+        Every step is timed and recorded so /ready can report it. Needs no
+        app context; one is pushed here.
+        """
+        steps = {}
+        with app.app_context():
+            started = time.perf_counter()
+            opened = 0
+            for engine in db.engines.values():
+                opened += _prefill_pool(engine, app.config.get('WARMUP_POOL_CONNECTIONS', 4))
+            steps['db_connections_opened'] = opened
+            steps['db_ms'] = _elapsed_ms(started)
+
+            if swagger is not None:
+                started = time.perf_counter()
+                with app.test_request_context():
+                    for spec in swagger.config['specs']:
+                        swagger.get_apispecs(spec['endpoint'])
+                steps['swagger_ms'] = _elapsed_ms(started)
+
+            # Loads the bcrypt backend and measures what one login costs here
+            started = time.perf_counter()
+            password_hash = AuthUtils.hash_password('warm-up-calibration')
+            AuthUtils.verify_password('warm-up-calibration', password_hash)
+            steps['bcrypt_ms'] = _elapsed_ms(started)
+
+        self.warmup = steps
+        self.ready = True
+        return steps
+
+    def skip_warm_up(self) -> None:
+        """Report ready without warming up (``WARMUP_ON_STARTUP`` is off)"""
+        self.warmup = {}
+        self.ready = True
+
+    def check(self, max_latency_ms: float) -> tuple:
+        """Return ``(report, healthy)`` after a DB round-trip on every engine"""
+        databases = {}
+        healthy = self.ready
+        for name, engine in db.engines.items():
+            started = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT 1'))
+                latency = _elapsed_ms(started)
+                status = 'ok' if latency <= max_latency_ms else 'slow'
+            except Exception as e:
+                latency = None
+                status = f'error: {e.__class__.__name__}'
+            if status != 'ok':
+                healthy = False
+            databases[name or 'default'] = {
+                'status': status,
+                'latency_ms': latency,
+                'pool': _pool_state(engine.pool)
+            }
+
+        report = {
+            'status': 'ready' if healthy else ('warming_up' if not self.ready else 'unavailable'),
+            'databases': databases,
+            'warmup': self.warmup
+        }
+        return report, healthy
+
+
+def _prefill_pool(engine, count: int) -> int:
+    """Open up to ``count`` pooled connections at once, then return them to the pool"""
+    pool_size = getattr(engine.pool, 'size', None)
+    if callable(pool_size):
+        count = min(count, pool_size())
+    else:
+        # Single-connection pools (e.g. in-memory SQLite) only need the one
+        count = 1
+    connections = []
+    try:
+        for _ in range(count):
+            conn = engine.connect()
+            conn.execute(text('SELECT 1'))
+            connections.append(conn)
+    finally:
+        for conn in connections:
+            conn.close()
+    return len(connections)
+
+
+def _pool_state(pool) -> dict:
+    """Describe a connection pool with whatever counters it exposes"""
+    state = {'type': pool.__class__.__name__}
+    for counter in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, counter, None)
+        if callable(method):
+            state[counter] = method()
+    return state
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
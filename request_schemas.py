@@ -0,0 +1,218 @@
+"""
+Declarative request schemas for the JSON endpoints
+
+Each schema is compiled once at import time from the constraints already
+expressed in ``swagger.yaml`` (required fields, minLength, maxLength, pattern)
+and the ``UserTbl`` column lengths, then decodes, normalizes and validates a
+request body in a single pass, returning a slotted request object.
+"""
+import json
+import os
+import re
+import yaml
+from models import UserTbl
+
+SWAGGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'swagger.yaml')
+
+# Worst-case bytes per character once JSON-escaped (\uXXXX), used to size body limits
+_ESCAPED_CHAR_BYTES = 6
+# Room for punctuation, whitespace and fields the schema ignores
+_BODY_SLACK_BYTES = 1024
+# Length budget for fields whose length is not constrained anywhere
+_DEFAULT_FIELD_BUDGET = 255
+
+
+class RequestValidationError(ValueError):
+    """Raised when a request body cannot be turned into a request object"""
+
+    def __init__(self, body: dict, status_code: int = 400):
+        super().__init__(body.get('message') or body.get('error'))
+        self.body = body
+        self.status_code = status_code
+
+
+class RegistrationRequest:
+    """Validated /v1/register payload"""
+    __slots__ = ('firstname', 'lastname', 'title', 'username', 'password')
+
+    firstname: str
+    lastname: str
+    title: str
+    username: str
+    password: str
+
+
+class LoginRequest:
+    """Validated /v1/login payload"""
+    __slots__ = ('username', 'password')
+
+    username: str
+    password: str
+
+
+class Field:
+    """A string field of a request schema"""
+    __slots__ = ('name', 'label', 'required', 'min_length', 'max_length', 'pattern',
+                 'pattern_message', 'strip', 'lower', 'blank_as_none')
+
+    def __init__(self, name: str, label: str = None, required: bool = False,
+                 min_length: int = None, max_length: int = None, pattern: str = None,
+                 pattern_message: str = None, strip: bool = True, lower: bool = False, blank_as_none: bool = False):
+        self.name = name
+        self.label = label or name.capitalize()
+        self.required = required
+        self.min_length = min_length
+        self.max_length = max_length
+        self.pattern = re.compile(pattern) if pattern else None
+        self.pattern_message = pattern_message or f"{self.label} contains invalid characters"
+        self.strip = strip
+        self.lower = lower
+        self.blank_as_none = blank_as_none
+
+    def parse(self, value):
+        """Return ``(value, error)`` for a raw JSON value"""
+        if value is None:
+            value = ''
+        elif not isinstance(value, str):
+            return None, f"{self.label} must be a string"
+
+        stripped = value.strip()
+        if not stripped:
+            if self.required:
+                return None, f"{self.name.capitalize()} is required"
+            return (None if self.blank_as_none else ''), None
+
+        if self.strip:
+            value = stripped
+        if self.min_length is not None and len(value) < self.min_length:
+            return None, f"{self.label} must be at least {self.min_length} characters long"
+        if self.max_length is not None and len(value) > self.max_length:
+            return None, f"{self.label} must be less than {self.max_length} characters"
+        if self.pattern is not None and not self.pattern.match(value):
+            return None, self.pattern_message
+        if self.lower:
+            value = value.lower()
+        return value, None
+
+
+class RequestSchema:
+    """A compiled set of fields that builds ``target`` objects from JSON bodies"""
+
+    def __init__(self, target: type, fields: list, error: str = 'Validation failed',
+                 message: str = None):
+        self.target = target
+        self.fields = tuple(fields)
+        # Errors are reported as {"error", "details"} unless a fixed message is given
+        self.error = error
+        self.message = message
+        self.max_body_bytes = _BODY_SLACK_BYTES + sum(
+            len(field.name) + 6 + (field.max_length or _DEFAULT_FIELD_BUDGET) * _ESCAPED_CHAR_BYTES
+            for field in self.fields
+        )
+
+    def load(self, data: dict):
+        """Normalize and validate a decoded JSON object into a request object"""
+        instance = self.target.__new__(self.target)
+        errors = None
+        for field in self.fields:
+            value, error = field.parse(data.get(field.name))
+            if error is None:
+                setattr(instance, field.name, value)
+            else:
+                if errors is None:
+                    errors = {}
+                errors[field.name] = error
+
+        if errors is not None:
+            if self.message is not None:
+                raise RequestValidationError({"error": self.error, "message": self.message})
+            raise RequestValidationError({"error": self.error, "details": errors})
+        return instance
+
+    def load_body(self, raw: bytes):
+        """Decode a raw JSON body and load it, rejecting oversized bodies first"""
+        if len(raw) > self.max_body_bytes:
+            raise self.too_large()
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = None
+        if not data or not isinstance(data, dict):
+            raise RequestValidationError({
+                "error": "Invalid JSON payload",
+                "message": "Request must contain JSON data"
+            })
+        return self.load(data)
+
+    def load_request(self, request):
+        """Load a Flask request body without reading more than the size limit"""
+        if not request.is_json:
+            raise RequestValidationError({
+                "error": "Unsupported media type",
+                "message": "Content-Type must be application/json"
+            }, 415)
+        if request.content_length is not None and request.content_length > self.max_body_bytes:
+            raise self.too_large()
+        return self.load_body(request.stream.read(self.max_body_bytes + 1))
+
+    def too_large(self) -> RequestValidationError:
+        return RequestValidationError({
+            "error": "Payload too large",
+            "message": f"Request body must not exceed {self.max_body_bytes} bytes"
+        }, 413)
+
+
+def _request_body_schema(spec: dict, path: str) -> dict:
+    """Return the JSON request body schema of a POST operation in the spec"""
+    return spec['paths'][path]['post']['requestBody']['content']['application/json']['schema']
+
+
+def _fields_from_spec(body_schema: dict, overrides: dict, model=None) -> list:
+    """Build fields from an OpenAPI object schema, capped by the model's column lengths"""
+    columns = model.__table__.columns if model is not None else {}
+    required = set(body_schema.get('required', ()))
+    fields = []
+    for name, prop in body_schema['properties'].items():
+        options = {
+            'required': name in required,
+            'min_length': prop.get('minLength'),
+            'max_length': prop.get('maxLength'),
+            'pattern': prop.get('pattern'),
+        }
+        if name in columns and getattr(columns[name].type, 'length', None):
+            column_length = columns[name].type.length
+            options['max_length'] = min(options['max_length'] or column_length, column_length)
+        options.update(overrides.get(name, {}))
+        fields.append(Field(name, **options))
+    return fields
+
+
+def _compile_schemas():
+    with open(SWAGGER_PATH, 'r') as file:
+        spec = yaml.safe_load(file)
+
+    register = RequestSchema(RegistrationRequest, _fields_from_spec(
+        _request_body_schema(spec, '/v1/register'),
+        {
+            'firstname': {'label': 'First name'},
+            'lastname': {'label': 'Last name'},
+            'title': {'blank_as_none': True},
+            'username': {
+                'lower': True,
+                'pattern_message': 'Username may only contain letters, digits and underscores'
+            },
+            'password': {'strip': False},
+        },
+        model=UserTbl
+    ))
+    login = RequestSchema(LoginRequest, _fields_from_spec(
+        _request_body_schema(spec, '/v1/login'),
+        {
+            'username': {'lower': True},
+            'password': {'strip': False},
+        }
+    ), error='Missing credentials', message='Username and password are required')
+    return register, login
+
+
+REGISTER_SCHEMA, LOGIN_SCHEMA = _compile_schemas()
@@ -0,0 +1,282 @@
+"""
+Slot-based sharding of the SESSION table across multiple database binds
+"""
+import os
+import uuid
+import zlib
+import click
+from flask import current_app
+from sqlalchemy import Column, Index, MetaData, Table, create_engine, delete, insert, select
+from sqlalchemy.engine import make_url
+from models import Session, db
+
+SHARD_BIND_PREFIX = 'session_shard_'
+
+# Users and sessions hash to one of a fixed number of slots; a slot lives on
+# shard ``slot % shard_count``. The slot never changes, only its shard does.
+SESSION_SLOTS = 256
+
+
+def shard_bind_key(shard: int) -> str:
+    """Return the Flask-SQLAlchemy bind key for a shard"""
+    return f'{SHARD_BIND_PREFIX}{shard}'
+
+
+def user_slot(user_id: int) -> int:
+    """Map a user to its slot using a stable (process independent) hash"""
+    return zlib.crc32(str(user_id).encode('utf-8')) % SESSION_SLOTS
+
+
+def session_slot(session_id: str) -> int:
+    """Return the slot a session ID was minted for.
+
+    Session IDs are UUIDv8 values whose first byte is their user's slot.
+    IDs minted before sharding existed (UUIDv4) fall back to a hash.
+    """
+    try:
+        parsed = uuid.UUID(session_id)
+    except (TypeError, ValueError, AttributeError):
+        parsed = None
+    if parsed is not None and parsed.version == 8:
+        return parsed.bytes[0]
+    return zlib.crc32(str(session_id).encode('utf-8')) % SESSION_SLOTS
+
+
+def slot_shard(slot: int, shard_count: int) -> int:
+    return slot % shard_count if shard_count > 1 else 0
+
+
+def _shard_table() -> Table:
+    """SESSION as created on shard databases: same columns and indexes, no FK.
+
+    USERTBL only exists in the main database, so shards cannot reference it.
+    """
+    table = Table(Session.__tablename__, MetaData(), *[
+        Column(column.name, column.type, primary_key=column.primary_key,
+               nullable=column.nullable, unique=column.unique, autoincrement=column.autoincrement)
+        for column in Session.__table__.columns
+    ])
+    for index in Session.__table__.indexes:
+        Index(index.name, *[table.c[column.name] for column in index.columns])
+    return table
+
+
+SHARD_TABLE = _shard_table()
+
+
+def create_session_table(engine) -> None:
+    """Create SESSION on an engine, without the USERTBL FK unless it is the main database"""
+    table = Session.__table__ if engine is db.engine else SHARD_TABLE
+    table.create(bind=engine, checkfirst=True)
+
+
+class SessionShards:
+    """Routes SESSION reads and writes to the shard that owns them.
+
+    Every session ID embeds its user's slot, so a session and its user always
+    map to the same shard: lookups by session ID and per-user operations
+    (e.g. evicting a user's sessions on login) each touch one database, for
+    any shard count. With a shard count of 0 or 1 everything stays on the
+    default database.
+    """
+
+    def __init__(self, app=None):
+        self.shard_count = 1
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Register one SQLAlchemy bind per shard. Call before ``db.init_app``"""
+        self.shard_count = max(int(app.config.get('SESSION_SHARD_COUNT') or 1), 1)
+        if self.shard_count > SESSION_SLOTS:
+            raise ValueError(f"SESSION_SHARD_COUNT must not exceed {SESSION_SLOTS}")
+        if self.enabled:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            template = app.config['SESSION_SHARD_URI_TEMPLATE']
+            for shard in range(self.shard_count):
+                binds[shard_bind_key(shard)] = template.format(shard=shard)
+            app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['session_shards'] = self
+        app.cli.add_command(rebalance_sessions_command)
+
+    @property
+    def enabled(self) -> bool:
+        return self.shard_count > 1
+
+    def create_all(self) -> None:
+        """Create the SESSION table on every shard (requires an app context)"""
+        for engine in self.engines():
+            create_session_table(engine)
+
+    def engines(self) -> list:
+        """Return the engines holding SESSION rows, indexed by shard"""
+        if not self.enabled:
+            return [db.engine]
+        return [db.engines[shard_bind_key(shard)] for shard in range(self.shard_count)]
+
+    def shard_for_session(self, session_id: str) -> int:
+        return slot_shard(session_slot(session_id), self.shard_count)
+
+    def shard_for_user(self, user_id: int) -> int:
+        return slot_shard(user_slot(user_id), self.shard_count)
+
+    def bind_for_shard(self, shard: int):
+        """Return ``bind_arguments`` for ``db.session.execute`` on a shard"""
+        if not self.enabled:
+            return None
+        return {'bind': db.engines[shard_bind_key(shard)]}
+
+    def bind_for_session(self, session_id: str):
+        """Return ``bind_arguments`` for the shard owning a session ID"""
+        return self.bind_for_shard(self.shard_for_session(session_id))
+
+    def bind_for_user(self, user_id: int):
+        """Return ``bind_arguments`` for the shard owning a user's sessions"""
+        return self.bind_for_shard(self.shard_for_user(user_id))
+
+    @staticmethod
+    def generate_session_id(user_id: int) -> str:
+        """Generate a random UUIDv8 session ID carrying the user's slot in its first byte"""
+        raw = bytearray(uuid.uuid4().bytes)
+        raw[0] = user_slot(user_id)
+        raw[6] = (raw[6] & 0x0F) | 0x80  # version 8 (custom layout), variant stays RFC 4122
+        return str(uuid.UUID(bytes=bytes(raw)))
+
+
+def get_session_shards() -> SessionShards:
+    """Return the shard router of the current app (unsharded if not set up)"""
+    return current_app.extensions.get('session_shards') or SessionShards()
+
+
+def rebalance_sessions(source_engines: list, target_engines: list) -> dict:
+    """Move SESSION rows from one shard layout to another.
+
+    Each row moves to the target shard of its session slot, which for every
+    slot-carrying session ID is also its user's shard, so nothing is logged
+    out. Only sessions minted before slots existed can end up away from
+    their user's shard; those are deactivated rather than left behind where
+    per-user operations (logout everywhere) could not reach them.
+
+    The app must be stopped or drained while this runs: requests still
+    routed to the old layout would write sessions the rebalance never sees.
+    Every row is copied and committed on the target before it is deleted
+    from the source, and rows already on the target are skipped, so a
+    rebalance interrupted before the app restarts can be run again. A
+    session deactivated on the source after it was copied (a straggling
+    logout) is deactivated on the target too.
+    """
+    table = SHARD_TABLE
+    target_count = len(target_engines)
+    stats = {'scanned': 0, 'moved': 0, 'deactivated': 0}
+
+    for engine in target_engines:
+        create_session_table(engine)
+
+    # Snapshot first so rows moved onto a later source are not scanned twice
+    snapshots = []
+    for source in source_engines:
+        with source.connect() as conn:
+            snapshots.append((source, conn.execute(select(table)).mappings().all()))
+
+    for source, rows in snapshots:
+        for row in rows:
+            stats['scanned'] += 1
+            shard = slot_shard(session_slot(row['session_id']), target_count)
+            target = target_engines[shard]
+            values = dict(row)
+            if values['is_active'] and shard != slot_shard(user_slot(values['user_id']), target_count):
+                values['is_active'] = False
+                stats['deactivated'] += 1
+
+            if target is source:
+                if values['is_active'] != row['is_active']:
+                    with source.begin() as conn:
+                        conn.execute(
+                            table.update()
+                            .where(table.c.id == row['id'])
+                            .values(is_active=False)
+                        )
+                continue
+
+            # Row IDs are only unique per shard, let the target assign one
+            values.pop('id')
+            with target.begin() as conn:
+                existing = conn.execute(
+                    select(table.c.id).where(table.c.session_id == values['session_id'])
+                ).first()
+                if existing is None:
+                    conn.execute(insert(table).values(**values))
+                elif not values['is_active']:
+                    conn.execute(table.update().where(table.c.id == existing.id).values(is_active=False))
+            with source.begin() as conn:
+                deleted = conn.execute(
+                    delete(table).where(table.c.id == row['id']).returning(table.c.is_active)
+                ).first()
+            if deleted is not None and not deleted.is_active and values['is_active']:
+                # Deactivated on the source after the snapshot, do not resurrect it
+                with target.begin() as conn:
+                    conn.execute(
+                        table.update()
+                        .where(table.c.session_id == values['session_id'])
+                        .values(is_active=False)
+                    )
+            stats['moved'] += 1
+
+    return stats
+
+
+def _resolve_sqlite_uri(uri: str):
+    """Resolve relative SQLite paths against the instance folder like Flask-SQLAlchemy"""
+    url = make_url(uri)
+    if url.drivername.startswith('sqlite') and url.database and url.database != ':memory:' \
+            and not os.path.isabs(url.database):
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        url = url.set(database=os.path.join(current_app.instance_path, url.database))
+    return url
+
+
+@click.command('rebalance-sessions')
+@click.option('--to', 'target_count', type=int, required=True,
+              help='Shard count to rebalance to (1 means the default database)')
+@click.option('--uri-template', default=None,
+              help='Target shard URI template, defaults to SESSION_SHARD_URI_TEMPLATE')
+@click.option('--traffic-stopped', is_flag=True,
+              help='Confirm every app process is stopped or drained (required)')
+def rebalance_sessions_command(target_count: int, uri_template: str, traffic_stopped: bool) -> None:
+    """Redistribute sessions for a new SESSION_SHARD_COUNT.
+
+    Run it with every app process stopped or drained, then start the app
+    with the new SESSION_SHARD_COUNT.
+    """
+    if not traffic_stopped:
+        raise click.UsageError(
+            "Stop or drain every app process first, then pass --traffic-stopped. "
+            "Logins and logouts served on the old layout during a rebalance are lost."
+        )
+    shards = get_session_shards()
+    template = uri_template or current_app.config['SESSION_SHARD_URI_TEMPLATE']
+
+    binds = current_app.config.get('SQLALCHEMY_BINDS') or {}
+
+    if target_count <= 1:
+        targets = [db.engine]
+    else:
+        targets = []
+        for shard in range(target_count):
+            uri = template.format(shard=shard)
+            key = shard_bind_key(shard)
+            if shards.enabled and binds.get(key) == uri:
+                targets.append(db.engines[key])
+            else:
+                targets.append(create_engine(_resolve_sqlite_uri(uri)))
+
+    stats = rebalance_sessions(shards.engines(), targets)
+    click.echo(
+        f"Rebalanced {stats['scanned']} sessions from {shards.shard_count} to "
+        f"{max(target_count, 1)} shard(s): {stats['moved']} moved, "
+        f"{stats['deactivated']} deactivated"
+    )
+    click.echo(
+        f"Start the app with SESSION_SHARD_COUNT={max(target_count, 1)}; "
+        f"keep it stopped until then, or re-run this command first"
+    )
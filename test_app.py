@@ -1,30 +1,70 @@
 import unittest
 import json
 import os
-from app import app, db
-from models import UserTbl, Session
-from auth_utils import AuthUtils
+import tempfile
+import time
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from unittest import mock
+from flask import Flask
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+# Select the testing profile before the app reads its configuration: an
+# in-memory database per process (safe for parallel runs) and cheap bcrypt
+os.environ['FLASK_ENV'] = 'testing'
+
+from app import app, db  # noqa: E402
+from models import UserTbl, Session  # noqa: E402
+from auth_utils import AuthUtils  # noqa: E402
+from request_schemas import REGISTER_SCHEMA, RegistrationRequest, RequestValidationError  # noqa: E402
+from readiness import Readiness  # noqa: E402
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from loadgen import FlaskTransport, LoadRunner, UserPool, read_trace, summarize, synthesize, write_ndjson  # noqa: E402
+from session_shards import (  # noqa: E402
+    SessionShards, create_session_table, rebalance_sessions, session_slot, slot_shard, user_slot
+)
+
+
+def setUpModule():
+    """Let pysqlite run real SAVEPOINTs so each test can be rolled back.
+
+    The schema was already created once when the app was imported and is
+    shared by every test. See "Serializable isolation / Savepoints /
+    Transactional DDL" in the SQLAlchemy SQLite dialect docs.
+    """
+    with app.app_context():
+        with db.engine.connect() as conn:
+            conn.connection.dbapi_connection.isolation_level = None
+        event.listen(db.engine, 'connect',
+                     lambda dbapi_connection, record: setattr(dbapi_connection, 'isolation_level', None))
+        event.listen(db.engine, 'begin', lambda conn: conn.exec_driver_sql('BEGIN'))
+
 
 class TestHelloWorldAPI(unittest.TestCase):
     
     def setUp(self):
-        """Set up test client and test database"""
-        # Set testing configuration
-        os.environ['FLASK_ENV'] = 'testing'
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-        
+        """Set up test client and a transaction rolled back after the test"""
         self.app = app.test_client()
         self.app_context = app.app_context()
         self.app_context.push()
         
-        # Create tables
-        db.create_all()
+        # Commits made by the app only release savepoints inside this transaction
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.app_session = db.session
+        db.session = scoped_session(sessionmaker(
+            bind=self.connection, join_transaction_mode='create_savepoint'
+        ))
 
     def tearDown(self):
-        """Clean up after tests"""
+        """Roll back everything the test wrote"""
+        app.extensions['db_breaker'].reset()
         db.session.remove()
-        db.drop_all()
+        db.session = self.app_session
+        self.transaction.rollback()
+        self.connection.close()
         self.app_context.pop()
 
     def test_hello_world_endpoint(self):
@@ -108,6 +148,95 @@ class TestHelloWorldAPI(unittest.TestCase):
         self.assertEqual(data['error'], 'Validation failed')
         self.assertIn('details', data)
 
+    def test_register_endpoint_invalid_json(self):
+        """Test registration with a body that is not a JSON object"""
+        for body in ('invalid json', '[]', '{}'):
+            response = self.app.post('/v1/register',
+                                    data=body,
+                                    content_type='application/json')
+            
+            self.assertEqual(response.status_code, 400)
+            
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['error'], 'Invalid JSON payload')
+
+    def test_register_endpoint_requires_json_content_type(self):
+        """Test a JSON body sent with another Content-Type is rejected"""
+        user_data = {
+            'firstname': 'John',
+            'lastname': 'Doe',
+            'username': 'johndoe',
+            'password': 'password123'
+        }
+        
+        for content_type in ('text/plain', None):
+            response = self.app.post('/v1/register',
+                                    data=json.dumps(user_data),
+                                    content_type=content_type)
+            
+            self.assertEqual(response.status_code, 415)
+            
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['error'], 'Unsupported media type')
+        self.assertIsNone(db.session.execute(
+            db.select(UserTbl).filter_by(username='johndoe')
+        ).scalar_one_or_none())
+
+    def test_register_endpoint_oversized_body(self):
+        """Test oversized bodies are rejected before being parsed"""
+        response = self.app.post('/v1/register',
+                                data='{"firstname": "' + 'x' * REGISTER_SCHEMA.max_body_bytes + '"}',
+                                content_type='application/json')
+        
+        self.assertEqual(response.status_code, 413)
+        
+        data = json.loads(response.data.decode())
+        self.assertEqual(data['error'], 'Payload too large')
+
+    def test_register_endpoint_field_errors(self):
+        """Test per-field validation errors"""
+        user_data = {
+            'firstname': 42,
+            'lastname': 'Doe',
+            'title': 'x' * 51,
+            'username': 'john doe',
+            'password': 'short'
+        }
+        
+        response = self.app.post('/v1/register',
+                                data=json.dumps(user_data),
+                                content_type='application/json')
+        
+        self.assertEqual(response.status_code, 400)
+        
+        data = json.loads(response.data.decode())
+        self.assertEqual(set(data['details']), {'firstname', 'title', 'username', 'password'})
+        self.assertEqual(data['details']['password'], 'Password must be at least 6 characters long')
+        self.assertEqual(data['details']['title'], 'Title must be less than 50 characters')
+        self.assertEqual(data['details']['username'],
+                         'Username may only contain letters, digits and underscores')
+
+    def test_registration_schema_normalizes(self):
+        """Test the registration schema strips, lowercases and drops blank titles"""
+        payload = REGISTER_SCHEMA.load({
+            'firstname': '  John ',
+            'lastname': 'Doe',
+            'title': '   ',
+            'username': ' JohnDoe ',
+            'password': ' secret pass '
+        })
+        
+        self.assertIsInstance(payload, RegistrationRequest)
+        self.assertEqual(payload.firstname, 'John')
+        self.assertIsNone(payload.title)
+        self.assertEqual(payload.username, 'johndoe')
+        self.assertEqual(payload.password, ' secret pass ')
+        self.assertFalse(hasattr(payload, '__dict__'))
+        
+        with self.assertRaises(RequestValidationError) as context:
+            REGISTER_SCHEMA.load({'firstname': 'John'})
+        self.assertEqual(context.exception.body['details']['username'], 'Username is required')
+
     def test_login_endpoint_success(self):
         """Test successful login"""
         # First register a user
@@ -239,11 +368,547 @@ class TestHelloWorldAPI(unittest.TestCase):
         data = json.loads(response.data.decode())
         self.assertEqual(data['message'], 'Logout successful')
 
+    def login_user(self):
+        """Register johndoe if needed and return a new session ID"""
+        user_data = {
+            'firstname': 'John',
+            'lastname': 'Doe',
+            'username': 'johndoe',
+            'password': 'securepassword123'
+        }
+        
+        self.app.post('/v1/register',
+                     data=json.dumps(user_data),
+                     content_type='application/json')
+        
+        login_data = {
+            'username': 'johndoe',
+            'password': 'securepassword123'
+        }
+        
+        login_response = self.app.post('/v1/login',
+                                     data=json.dumps(login_data),
+                                     content_type='application/json')
+        
+        return login_response.headers.get('sessionid')
+
+    @contextmanager
+    def count_statements(self):
+        """Collect the SQL statements sent to the main database"""
+        statements = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            # Savepoints only exist because of the rolled back test transaction
+            if not statement.startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK TO')):
+                statements.append(statement)
+        
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+    def test_register_is_single_statement(self):
+        """Test registration is one INSERT ... RETURNING, duplicates included"""
+        user_data = {
+            'firstname': 'John',
+            'lastname': 'Doe',
+            'username': 'johndoe',
+            'password': 'securepassword123'
+        }
+        
+        for expected_status in (201, 409):
+            with self.count_statements() as statements:
+                response = self.app.post('/v1/register',
+                                        data=json.dumps(user_data),
+                                        content_type='application/json')
+            
+            self.assertEqual(response.status_code, expected_status)
+            self.assertEqual(len(statements), 1)
+            self.assertTrue(statements[0].startswith('INSERT INTO "USERTBL"'))
+            self.assertIn('RETURNING', statements[0])
+
+    def test_login_statement_count(self):
+        """Test login is a user lookup plus a two statement session rotation"""
+        self.login_user()
+        login_data = {
+            'username': 'johndoe',
+            'password': 'securepassword123'
+        }
+        
+        with self.count_statements() as statements:
+            response = self.app.post('/v1/login',
+                                    data=json.dumps(login_data),
+                                    content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([statement.split()[0] for statement in statements],
+                         ['SELECT', 'UPDATE', 'INSERT'])
+
+    def test_login_keeps_other_devices_signed_in(self):
+        """Test logging in again does not invalidate sessions below the cap"""
+        first_session = self.login_user()
+        second_session = self.login_user()
+        
+        for session_id in (first_session, second_session):
+            response = self.app.get('/v1/validate-session',
+                                   headers={'sessionid': session_id})
+            self.assertEqual(response.status_code, 200)
+
+    def test_login_evicts_oldest_sessions_beyond_cap(self):
+        """Test logging in beyond MAX_SESSIONS_PER_USER evicts the oldest sessions"""
+        previous_cap = app.config['MAX_SESSIONS_PER_USER']
+        app.config['MAX_SESSIONS_PER_USER'] = 2
+        try:
+            session_ids = [self.login_user() for _ in range(3)]
+        finally:
+            app.config['MAX_SESSIONS_PER_USER'] = previous_cap
+        
+        statuses = [
+            self.app.get('/v1/validate-session',
+                         headers={'sessionid': session_id}).status_code
+            for session_id in session_ids
+        ]
+        self.assertEqual(statuses, [401, 200, 200])
+
+    def test_logout_all_endpoint(self):
+        """Test logging out everywhere invalidates every session of the user"""
+        session_ids = [self.login_user() for _ in range(3)]
+        
+        response = self.app.post('/v1/logout-all',
+                               headers={'sessionid': session_ids[0]})
+        
+        self.assertEqual(response.status_code, 200)
+        
+        data = json.loads(response.data.decode())
+        self.assertEqual(data['message'], 'Logged out from all sessions')
+        self.assertEqual(data['sessions_invalidated'], 3)
+        
+        for session_id in session_ids:
+            response = self.app.get('/v1/validate-session',
+                                   headers={'sessionid': session_id})
+            self.assertEqual(response.status_code, 401)
+
+    def test_logout_all_endpoint_invalid_session(self):
+        """Test logging out everywhere requires a valid session"""
+        response = self.app.post('/v1/logout-all',
+                               headers={'sessionid': 'not-a-session'})
+        
+        self.assertEqual(response.status_code, 401)
+
+    @contextmanager
+    def database_down(self):
+        """Make every statement sent through the session fail like a lost database"""
+        failure = OperationalError('SELECT 1', {}, Exception('database is locked'))
+        with mock.patch.object(db.session, 'execute', side_effect=failure) as execute:
+            yield execute
+
+    def test_validate_session_serves_stale_during_outage(self):
+        """Test recently validated sessions are answered stale while the database fails"""
+        session_id = self.login_user()
+        self.app.get('/v1/validate-session', headers={'sessionid': session_id})
+        stale_served = app.extensions['session_lkg_store'].metrics['stale_served']
+        
+        with self.database_down():
+            response = self.app.get('/v1/validate-session', headers={'sessionid': session_id})
+        
+        self.assertEqual(response.status_code, 200)
+        
+        data = json.loads(response.data.decode())
+        self.assertTrue(data['stale'])
+        self.assertEqual(data['user']['username'], 'johndoe')
+        self.assertEqual(app.extensions['session_lkg_store'].metrics['stale_served'], stale_served + 1)
+
+    def test_validate_session_sheds_unknown_sessions_during_outage(self):
+        """Test sessions without a recent good result are shed with 503"""
+        session_id = self.login_user()
+        
+        with self.database_down():
+            response = self.app.get('/v1/validate-session', headers={'sessionid': session_id})
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        
+        data = json.loads(response.data.decode())
+        self.assertEqual(data['error'], 'Service unavailable')
+
+    def test_validate_session_stale_window(self):
+        """Test results older than the staleness window are not served"""
+        session_id = self.login_user()
+        self.app.get('/v1/validate-session', headers={'sessionid': session_id})
+        store = app.extensions['session_lkg_store']
+        
+        with mock.patch.object(store, 'stale_window', -1), self.database_down():
+            response = self.app.get('/v1/validate-session', headers={'sessionid': session_id})
+        
+        self.assertEqual(response.status_code, 503)
+
+    def test_logout_is_not_served_stale(self):
+        """Test a logged out session is dropped from the last-known-good store"""
+        session_id = self.login_user()
+        self.app.get('/v1/validate-session', headers={'sessionid': session_id})
+        self.app.post('/v1/logout', headers={'sessionid': session_id})
+        
+        with self.database_down():
+            response = self.app.get('/v1/validate-session', headers={'sessionid': session_id})
+        
+        self.assertEqual(response.status_code, 503)
+
+    def test_evicted_session_is_not_served_stale(self):
+        """Test sessions evicted by the per-user cap are dropped from the last-known-good store"""
+        with mock.patch.dict(app.config, {'MAX_SESSIONS_PER_USER': 1}):
+            first = self.login_user()
+            self.app.get('/v1/validate-session', headers={'sessionid': first})
+            second = self.login_user()
+        
+        with self.database_down():
+            evicted = self.app.get('/v1/validate-session', headers={'sessionid': first})
+        
+        self.assertEqual(evicted.status_code, 503)
+        self.assertNotEqual(first, second)
+
+    def test_logout_all_and_expiry_clear_stale_sessions(self):
+        """Test logout-all and expired sessions leave nothing to serve stale"""
+        store = app.extensions['session_lkg_store']
+        expiring = self.login_user()
+        remaining = self.login_user()
+        for session_id in (expiring, remaining):
+            self.app.get('/v1/validate-session', headers={'sessionid': session_id})
+        
+        db.session.execute(
+            db.update(Session).filter_by(session_id=expiring)
+            .values(expires_at=datetime.utcnow() - timedelta(minutes=1))
+        )
+        self.assertIsNone(AuthUtils.validate_session(expiring))
+        self.assertNotIn(expiring, store.entries)
+        
+        self.app.post('/v1/logout-all', headers={'sessionid': remaining})
+        self.assertNotIn(remaining, store.entries)
+
+    def test_breaker_opens_and_sheds_without_database_calls(self):
+        """Test the breaker opens after repeated failures and stops calling the database"""
+        breaker = app.extensions['db_breaker']
+        
+        with mock.patch.object(breaker, 'failure_threshold', 2), self.database_down() as execute:
+            for _ in range(2):
+                self.app.get('/v1/validate-session', headers={'sessionid': 'unknown'})
+            calls = execute.call_count
+            
+            response = self.app.post('/v1/login',
+                                    data=json.dumps({'username': 'johndoe', 'password': 'secret123'}),
+                                    content_type='application/json')
+            
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(execute.call_count, calls)
+        
+        data = json.loads(self.app.get('/metrics').data.decode())
+        self.assertEqual(data['db_breaker']['state'], 'open')
+        self.assertEqual(data['db_breaker']['opened'], 1)
+        self.assertGreaterEqual(data['session_store']['shed'], 2)
+
+    def test_breaker_half_open_trial(self):
+        """Test an open breaker lets one trial call through after the reset timeout"""
+        breaker = CircuitBreaker()
+        breaker.failure_threshold = 1
+        breaker.reset_timeout = 0
+        
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow())
+
+    def test_breaker_interrupted_trial_frees_slot(self):
+        """Test a half-open trial interrupted by a BaseException does not block later calls"""
+        breaker = CircuitBreaker()
+        breaker.failure_threshold = 1
+        breaker.reset_timeout = 0
+        breaker.record_failure()
+        
+        with self.assertRaises(KeyboardInterrupt):
+            with breaker.guard():
+                raise KeyboardInterrupt()
+        
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertFalse(breaker.trial_in_flight)
+        with breaker.guard():
+            pass
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_load_generator_mix(self):
+        """Test a synthetic load mix runs end to end and replays from NDJSON"""
+        events = list(synthesize({'register': 1, 'login': 2, 'validate': 5, 'logout': 1},
+                                 rate=1000, duration=0.1, users=5, seed=7))
+        runner = LoadRunner(FlaskTransport(self.app), UserPool('loadtest'), concurrency=1)
+        
+        results = runner.run(events, speed=1e6)
+        report = summarize(results)
+        
+        self.assertEqual(report['all']['requests'], len(events))
+        self.assertEqual(report['all']['error_rate'], 0)
+        self.assertTrue(all(result['status'] < 400 for result in results))
+        self.assertEqual(report['register']['requests'], 5)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.ndjson')
+            write_ndjson(path, results)
+            replayed = read_trace(path)
+        self.assertEqual([(event['op'], event['user']) for event in replayed],
+                         [(result['op'], result['user']) for result in results])
+
+    def test_load_generator_counts_queue_wait_as_lag(self):
+        """Test time spent waiting for a free worker shows up as lag"""
+        def slow_transport(method, path, headers=None, body=None):
+            time.sleep(0.05)
+            return 201, {}
+        events = [{'t': 0, 'op': 'register', 'user': user} for user in range(3)]
+        runner = LoadRunner(slow_transport, UserPool('loadtest'), concurrency=1)
+        
+        results = runner.run(events)
+        report = summarize(results)
+        
+        self.assertGreaterEqual(max(result['lag_ms'] for result in results), 90)
+        self.assertGreaterEqual(report['all']['lag_max_ms'], 90)
+        self.assertLess(report['all']['max_ms'], 90)
+
+    def test_load_generator_records_schedule_not_send_time(self):
+        """Test a trace recorded while falling behind replays the original schedule"""
+        def slow_transport(method, path, headers=None, body=None):
+            time.sleep(0.05)
+            return 201, {}
+        events = [{'t': offset, 'op': 'register', 'user': user}
+                  for user, offset in enumerate((0, 0.01, 0.02))]
+        results = LoadRunner(slow_transport, UserPool('loadtest'), concurrency=1).run(events)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.ndjson')
+            write_ndjson(path, results)
+            replayed = read_trace(path)
+        
+        self.assertGreaterEqual(results[-1]['sent_t'], 0.09)
+        self.assertEqual([event['t'] for event in replayed], [0, 0.01, 0.02])
+        rerun = LoadRunner(slow_transport, UserPool('loadtest'), concurrency=1).run(replayed)
+        self.assertEqual([result['t'] for result in rerun], [0, 0.01, 0.02])
+
     def test_nonexistent_endpoint(self):
         """Test accessing a non-existent endpoint"""
         response = self.app.get('/v1/nonexistent')
         
         self.assertEqual(response.status_code, 404)
 
+class TestReadiness(unittest.TestCase):
+    
+    def setUp(self):
+        """Set up test client without a test transaction, the probe opens its own connections"""
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_ready_endpoint(self):
+        """Test the /ready GET endpoint after the startup warm-up"""
+        response = self.app.get('/ready')
+        
+        self.assertEqual(response.status_code, 200)
+        
+        data = json.loads(response.data.decode())
+        self.assertEqual(data['status'], 'ready')
+        self.assertEqual(data['databases']['default']['status'], 'ok')
+        self.assertIn('pool', data['databases']['default'])
+        self.assertIn('bcrypt_ms', data['warmup'])
+
+    def test_readiness_before_warm_up(self):
+        """Test readiness is reported as warming up until warm-up ran"""
+        report, healthy = Readiness().check(max_latency_ms=500)
+        
+        self.assertFalse(healthy)
+        self.assertEqual(report['status'], 'warming_up')
+
+    def test_readiness_without_warm_up(self):
+        """Test readiness does not wait for a warm-up that is disabled"""
+        readiness = Readiness()
+        readiness.skip_warm_up()
+        
+        report, healthy = readiness.check(max_latency_ms=500)
+        
+        self.assertTrue(healthy)
+        self.assertEqual(report['status'], 'ready')
+        self.assertEqual(report['warmup'], {})
+
+    def test_readiness_slow_database(self):
+        """Test readiness fails when a database round-trip is over budget"""
+        readiness = Readiness()
+        readiness.ready = True
+        
+        report, healthy = readiness.check(max_latency_ms=-1)
+        
+        self.assertFalse(healthy)
+        self.assertEqual(report['databases']['default']['status'], 'slow')
+
+class TestSessionShards(unittest.TestCase):
+    
+    def setUp(self):
+        """Set up an app whose sessions are spread across in-memory shards"""
+        self.shard_app = Flask(__name__)
+        self.shard_app.config.update(
+            TESTING=True,
+            SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+            SESSION_SHARD_COUNT=4,
+            SESSION_SHARD_URI_TEMPLATE='sqlite://'
+        )
+        self.shards = SessionShards(self.shard_app)
+        db.init_app(self.shard_app)
+        
+        self.app_context = self.shard_app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.shards.create_all()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        self.app_context.pop()
+
+    def count_sessions(self, shard, **filters):
+        """Count SESSION rows on one shard"""
+        table = Session.__table__
+        query = table.select().filter_by(**filters)
+        with self.shards.engines()[shard].connect() as conn:
+            return len(conn.execute(query).all())
+
+    def test_session_lives_on_user_shard(self):
+        """Test sessions are stored on the shard of both their ID and their user"""
+        for user_id in range(1, 9):
+            session = AuthUtils.create_session(user_id)
+            shard = self.shards.shard_for_user(user_id)
+            self.assertEqual(session_slot(session.session_id), user_slot(user_id))
+            self.assertEqual(self.shards.shard_for_session(session.session_id), shard)
+            self.assertEqual(self.count_sessions(shard, session_id=session.session_id), 1)
+            self.assertEqual(AuthUtils.validate_session(session.session_id).user_id, user_id)
+
+    def test_login_deactivates_previous_session(self):
+        """Test a new session deactivates the user's previous one on its shard"""
+        first = AuthUtils.create_session(7, max_sessions=1)
+        second = AuthUtils.create_session(7, max_sessions=1)
+        
+        self.assertIsNone(AuthUtils.validate_session(first.session_id))
+        self.assertIsNotNone(AuthUtils.validate_session(second.session_id))
+        self.assertEqual(self.count_sessions(self.shards.shard_for_user(7), is_active=True), 1)
+
+    def test_invalidate_session(self):
+        """Test invalidating a session on its shard"""
+        session = AuthUtils.create_session(3)
+        
+        self.assertTrue(AuthUtils.invalidate_session(session.session_id))
+        self.assertIsNone(AuthUtils.validate_session(session.session_id))
+        self.assertFalse(AuthUtils.invalidate_session('missing-session-id'))
+
+    def find_session(self, engine, session_id):
+        """Return a SESSION row by session ID from one engine"""
+        with engine.connect() as conn:
+            return conn.execute(
+                Session.__table__.select().filter_by(session_id=session_id)
+            ).mappings().one_or_none()
+
+    def test_rebalance_sessions(self):
+        """Test rebalancing moves sessions to their user's new shard and keeps them active"""
+        sessions = [AuthUtils.create_session(user_id) for user_id in range(1, 21)]
+        db.session.remove()
+        targets = self.shards.engines()[:3]
+        
+        stats = rebalance_sessions(self.shards.engines(), targets)
+        
+        self.assertEqual(stats['scanned'], 20)
+        self.assertEqual(stats['deactivated'], 0)
+        for session in sessions:
+            shard = slot_shard(user_slot(session.user_id), 3)
+            row = self.find_session(targets[shard], session.session_id)
+            self.assertTrue(row['is_active'])
+        self.assertEqual(self.count_sessions(3), 0)
+
+    def test_rebalance_sessions_is_retryable(self):
+        """Test a rebalance interrupted after copying a row can be run again"""
+        sessions = [AuthUtils.create_session(user_id) for user_id in range(1, 21)]
+        db.session.remove()
+        targets = self.shards.engines()[:2]
+        # Simulate a run that committed a copy on the target but died before deleting the source
+        moving = next(s for s in sessions if self.shards.shard_for_session(s.session_id) >= 2)
+        source = self.shards.engines()[self.shards.shard_for_session(moving.session_id)]
+        row = dict(self.find_session(source, moving.session_id))
+        row.pop('id')
+        with targets[slot_shard(session_slot(moving.session_id), 2)].begin() as conn:
+            conn.execute(Session.__table__.insert().values(**row))
+        
+        first = rebalance_sessions(self.shards.engines(), targets)
+        second = rebalance_sessions(self.shards.engines(), targets)
+        
+        self.assertEqual(first['scanned'], 21)
+        self.assertEqual(second['moved'], 0)
+        self.assertEqual(sum(self.count_sessions(shard) for shard in range(4)), 20)
+        for session in sessions:
+            shard = slot_shard(session_slot(session.session_id), 2)
+            self.assertTrue(self.find_session(targets[shard], session.session_id)['is_active'])
+
+    def test_rebalance_keeps_logout_between_copy_and_delete(self):
+        """Test a logout landing after a row was copied is not undone by the move"""
+        user_id = next(user_id for user_id in range(1, 100) if self.shards.shard_for_user(user_id) == 3)
+        session = AuthUtils.create_session(user_id)
+        db.session.remove()
+        source = self.shards.engines()[3]
+        targets = self.shards.engines()[:2]
+        target = targets[slot_shard(user_slot(user_id), 2)]
+        
+        # The copy commits on the target, then the logout reaches the old shard before the delete
+        steps = []
+        
+        def record_copy(conn, clause, *args):
+            if clause.is_insert:
+                steps.append('copied')
+        
+        def log_out_after_copy(conn):
+            if steps == ['copied']:
+                steps.append(AuthUtils.invalidate_session(session.session_id))
+        
+        event.listen(target, 'after_execute', record_copy)
+        event.listen(target, 'commit', log_out_after_copy)
+        stats = rebalance_sessions([source], targets)
+        
+        self.assertEqual(stats['moved'], 1)
+        self.assertEqual(steps, ['copied', True])
+        self.assertEqual(self.count_sessions(3), 0)
+        self.assertFalse(self.find_session(target, session.session_id)['is_active'])
+
+    def test_rebalance_command_requires_stopped_traffic(self):
+        """Test the rebalance command refuses to run unless traffic is stopped"""
+        session = AuthUtils.create_session(5)
+        db.session.remove()
+        runner = self.shard_app.test_cli_runner()
+        
+        refused = runner.invoke(args=['rebalance-sessions', '--to', '4'])
+        
+        self.assertNotEqual(refused.exit_code, 0)
+        self.assertIn('--traffic-stopped', refused.output)
+        
+        done = runner.invoke(args=['rebalance-sessions', '--to', '4', '--traffic-stopped'])
+        
+        self.assertEqual(done.exit_code, 0, done.output)
+        self.assertIn('Rebalanced 1 sessions', done.output)
+        self.assertIsNotNone(AuthUtils.validate_session(session.session_id))
+
+    def test_shard_tables_have_no_user_foreign_key(self):
+        """Test shard databases get SESSION without the FK to the main database's USERTBL"""
+        for engine in self.shards.engines():
+            with engine.connect() as conn:
+                self.assertEqual(inspect(conn).get_foreign_keys('SESSION'), [])
+        create_session_table(db.engine)
+        self.assertEqual(len(inspect(db.engine).get_foreign_keys('SESSION')), 1)
+
 if __name__ == '__main__':
     unittest.main()